@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Overload scenario for the admission control middleware.
+Drives a simulated resolver at a multiple of its capacity and reports latency
+percentiles, shed counts and queue depth. Exits non-zero if admitted p99 exceeds
+the queue timeout plus service time or any mutation is shed.
+Run with 'python backend-python/load_test.py'.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, backend_dir)
+
+from src.admission import AdmissionController, AdmissionControlMiddleware
+
+CONCURRENCY_LIMIT = 8
+SERVICE_TIME = 0.05
+OVERLOAD_FACTOR = 3
+DURATION = 5.0
+MUTATION_SHARE = 0.1
+QUEUE_TIMEOUT = 0.25
+
+
+async def _resolver(scope, receive, send):
+    await receive()
+    await asyncio.sleep(SERVICE_TIME)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+async def _request(app, client: int, mutation: bool, results: list):
+    body = b'{"query": "mutation { updateToyOrderElf }"}' if mutation else b'{"query": "{ toyOrders { id } }"}'
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': '/graphql',
+        'headers': [],
+        'client': (f'10.0.0.{client % 250}', 0)
+    }
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    results.append((status, mutation, time.perf_counter() - start))
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def run(duration: float = DURATION) -> dict:
+    # Rate limiting stays at the defaults; the load is spread over many clients
+    controller = AdmissionController(
+        route_limits={'/graphql': CONCURRENCY_LIMIT},
+        max_queue=CONCURRENCY_LIMIT * 2,
+        queue_timeout=QUEUE_TIMEOUT
+    )
+    app = AdmissionControlMiddleware(_resolver, controller)
+    capacity = CONCURRENCY_LIMIT / SERVICE_TIME
+    interval = 1 / (capacity * OVERLOAD_FACTOR)
+    results = []
+    tasks = []
+    max_depth = 0
+
+    print(f'Capacity {capacity:.0f} req/s, offering {capacity * OVERLOAD_FACTOR:.0f} req/s for {duration}s')
+
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < duration:
+        mutation = sent % int(1 / MUTATION_SHARE) == 0
+        tasks.append(asyncio.create_task(_request(app, sent, mutation, results)))
+        sent += 1
+        max_depth = max(max_depth, controller.stats()['queue_depth'])
+        # Sleep to the next scheduled arrival rather than a fixed interval so event loop lag does not lower the offered load
+        await asyncio.sleep(max(0, start + sent * interval - time.perf_counter()))
+    await asyncio.gather(*tasks)
+
+    ok = [latency for status, _, latency in results if status == 200]
+    ok_writes = [latency for status, mutation, latency in results if status == 200 and mutation]
+    shed = [latency for status, _, latency in results if status == 503]
+
+    summary = {
+        'sent': len(results),
+        'admitted': len(ok),
+        'shed': len(shed),
+        'rate_limited': sum(1 for status, _, _ in results if status == 429),
+        'max_queue_depth': max_depth,
+        'writes': sum(1 for _, mutation, _ in results if mutation),
+        'writes_admitted': len(ok_writes),
+        'p50': _percentile(ok, 0.5),
+        'p99': _percentile(ok, 0.99),
+        'write_p99': _percentile(ok_writes, 0.99),
+        'shed_p99': _percentile(shed, 0.99)
+    }
+
+    print(f"Sent {summary['sent']}, admitted {summary['admitted']}, shed {summary['shed']}, "
+          f"rate limited {summary['rate_limited']}, max queue depth {max_depth}")
+    print(f"Admitted p50 {summary['p50'] * 1000:.0f}ms, p99 {summary['p99'] * 1000:.0f}ms")
+    print(f"Mutations admitted {summary['writes_admitted']}/{summary['writes']}, "
+          f"p99 {summary['write_p99'] * 1000:.0f}ms")
+    print(f"Shed p99 {summary['shed_p99'] * 1000:.0f}ms")
+    return summary
+
+
+def check(summary: dict) -> List[str]:
+    """Return the ways the run broke the overload guarantees."""
+    failures = []
+    budget = QUEUE_TIMEOUT + SERVICE_TIME
+    if summary['p99'] > budget:
+        failures.append(f"admitted p99 {summary['p99'] * 1000:.0f}ms exceeds {budget * 1000:.0f}ms")
+    if summary['writes_admitted'] != summary['writes']:
+        failures.append(f"{summary['writes'] - summary['writes_admitted']} mutations were shed")
+    if summary['rate_limited']:
+        failures.append(f"{summary['rate_limited']} requests were rate limited")
+    if not summary['shed']:
+        failures.append(f'no requests were shed at {OVERLOAD_FACTOR}x capacity')
+    return failures
+
+
+if __name__ == '__main__':
+    failures = check(asyncio.run(run()))
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
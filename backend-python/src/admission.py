@@ -0,0 +1,388 @@
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .constants import (
+    ADMISSION_ROUTE_LIMITS, ADMISSION_DEFAULT_LIMIT, ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER, ADMISSION_RATE_PER_SECOND,
+    ADMISSION_BURST, ADMISSION_EXEMPT_PATHS, ADMISSION_TRUSTED_PROXIES,
+    ADMISSION_MAX_PEEK_BYTES
+)
+
+WRITE_PRIORITY = 0
+READ_PRIORITY = 1
+
+_MAX_TRACKED_CLIENTS = 10000
+
+_GRAPHQL_PREFIX = '/graphql'
+
+
+def _matches_prefix(path: str, prefix: str) -> bool:
+    return path == prefix or path.startswith(prefix.rstrip('/') + '/')
+
+
+class _RouteLimiter:
+    """Concurrency limit for one route group with a bounded priority wait queue."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued = 0
+        self._counter = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        if self.active < self.limit and not self._queued:
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        if self._queued >= self.max_queue and not self._evict(priority):
+            self.shed += 1
+            return False
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), fut))
+        self._queued += 1
+
+        try:
+            # asyncio.wait leaves fut alone on timeout and, unlike wait_for, never
+            # swallows a cancellation that races with the handoff
+            await asyncio.wait((fut,), timeout=timeout)
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before the client went away
+            if fut.done() and fut.result():
+                self.release()
+            else:
+                self._abandon(fut)
+            raise
+
+        if fut.done() and fut.result():
+            self.admitted += 1
+            return True
+
+        self._abandon(fut)
+        self.shed += 1
+        return False
+
+    def _abandon(self, fut: asyncio.Future):
+        """Drop a waiter that timed out or went away without being resolved."""
+        if not fut.done():
+            fut.cancel()
+            self._queued -= 1
+        self._compact()
+
+    def _compact(self):
+        # Dead entries are normally popped by release(); while slots are held for a
+        # long time they would pile up, so rebuild once they outnumber live waiters
+        if len(self._waiters) - self._queued > self._queued:
+            self._waiters = [entry for entry in self._waiters if not entry[2].done()]
+            heapq.heapify(self._waiters)
+
+    def _evict(self, priority: int) -> bool:
+        """Make room for a more urgent request by shedding the newest lowest-priority waiter."""
+        pending = [entry for entry in self._waiters if not entry[2].done()]
+        if not pending:
+            return False
+        victim = max(pending, key=lambda entry: (entry[0], entry[1]))
+        if victim[0] <= priority:
+            return False
+        victim[2].set_result(False)
+        self._queued -= 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # The slot is handed over directly so newcomers cannot jump the queue
+                self.active += 1
+                self._queued -= 1
+                fut.set_result(True)
+                return
+
+    def stats(self) -> dict:
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'queued': self.queued,
+            'admitted': self.admitted,
+            'shed': self.shed
+        }
+
+
+class _TokenBucket:
+    """Per-client token buckets refilled at a fixed rate."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = _MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        # Least recently seen client first, so the table is capped in O(1) per request
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def take(self, client: str) -> Optional[float]:
+        """Consume one token; return None if allowed, else seconds until the next token."""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+
+        if tokens < 1:
+            self._store(client, (tokens, now))
+            self.limited += 1
+            return (1 - tokens) / self.rate
+
+        self._store(client, (tokens - 1, now))
+        return None
+
+    def _store(self, client: str, entry: Tuple[float, float]):
+        self._buckets[client] = entry
+        self._buckets.move_to_end(client)
+        if len(self._buckets) > self.max_clients:
+            # The forgotten client starts again from a full bucket
+            self._buckets.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'clients': len(self._buckets),
+            'limited': self.limited
+        }
+
+
+class AdmissionController:
+    """
+    Shared admission state: per-route concurrency limiters with bounded wait
+    queues and per-client token buckets. Created once by the app and handed to
+    AdmissionControlMiddleware so the metrics endpoint can read the same instance.
+    """
+
+    def __init__(
+        self,
+        route_limits: Optional[Dict[str, int]] = None,
+        default_limit: int = ADMISSION_DEFAULT_LIMIT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        retry_after: int = ADMISSION_RETRY_AFTER,
+        rate_per_second: float = ADMISSION_RATE_PER_SECOND,
+        burst: int = ADMISSION_BURST,
+        exempt_paths: Optional[List[str]] = None,
+        trusted_proxies: Optional[List[str]] = None,
+        max_peek_bytes: int = ADMISSION_MAX_PEEK_BYTES
+    ):
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.exempt_paths = exempt_paths if exempt_paths is not None else ADMISSION_EXEMPT_PATHS
+        self.max_peek_bytes = max_peek_bytes
+        self.trusted_proxies = set(trusted_proxies if trusted_proxies is not None else ADMISSION_TRUSTED_PROXIES)
+
+        limits = route_limits if route_limits is not None else ADMISSION_ROUTE_LIMITS
+        # Longest prefix first so nested routes win over their parents
+        self._routes = sorted(
+            ((prefix, _RouteLimiter(limit, max_queue)) for prefix, limit in limits.items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+        self._default = _RouteLimiter(default_limit, max_queue)
+        self.rate_limiter = _TokenBucket(rate_per_second, burst)
+
+    def limiter_for(self, path: str) -> _RouteLimiter:
+        for prefix, limiter in self._routes:
+            if _matches_prefix(path, prefix):
+                return limiter
+        return self._default
+
+    def client_for(self, scope) -> Optional[str]:
+        """Return the address that identifies the client, or None if only a proxy is known."""
+        client = scope.get('client')
+        peer = client[0] if client else None
+        if peer is not None and peer not in self.trusted_proxies:
+            return peer
+
+        forwarded = [
+            value.decode('latin-1') for name, value in scope.get('headers', [])
+            if name == b'x-forwarded-for'
+        ]
+        hops = [hop.strip() for value in forwarded for hop in value.split(',') if hop.strip()]
+        # Walk back from the nearest hop; entries left of the first untrusted one can be spoofed
+        for hop in reversed(hops):
+            if hop not in self.trusted_proxies:
+                return hop
+        return None
+
+    def stats(self) -> dict:
+        routes = {prefix: limiter.stats() for prefix, limiter in self._routes}
+        routes['default'] = self._default.stats()
+        return {
+            'queue_depth': sum(route['queued'] for route in routes.values()),
+            'shed': sum(route['shed'] for route in routes.values()),
+            'routes': routes,
+            'rate_limit': self.rate_limiter.stats()
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware that rate limits each client, caps concurrent requests per
+    route group and sheds load with 503/Retry-After once the wait queue is full
+    or a request has waited longer than the queue timeout. GraphQL mutations and
+    non-GET REST calls are admitted ahead of queued reads.
+    """
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller if controller is not None else AdmissionController()
+
+    async def __call__(self, scope, receive, send):
+        controller = self.controller
+        if scope['type'] != 'http' or scope['path'] in controller.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        client = controller.client_for(scope)
+        wait = controller.rate_limiter.take(client) if client is not None else None
+        if wait is not None:
+            await _reject(send, 429, 'Too Many Requests', max(1, int(wait + 0.999)))
+            return
+
+        priority, receive = await _classify(scope, receive, controller.max_peek_bytes)
+        limiter = controller.limiter_for(scope['path'])
+
+        if not await limiter.acquire(priority, controller.queue_timeout):
+            await _reject(send, 503, 'Service Unavailable', controller.retry_after)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+async def _classify(scope, receive, max_peek_bytes: int):
+    """Return the request priority and a receive callable that replays any buffered body."""
+    if scope['method'] in ('GET', 'HEAD', 'OPTIONS'):
+        return READ_PRIORITY, receive
+
+    if not _matches_prefix(scope['path'], _GRAPHQL_PREFIX):
+        return WRITE_PRIORITY, receive
+
+    # GraphQL sends queries and mutations alike as POST, so peek at the document
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] != 'http.request':
+            # Client disconnected; let the app observe it
+            return READ_PRIORITY, _replay(message, receive)
+        chunk = message.get('body', b'')
+        chunks.append(chunk)
+        size += len(chunk)
+        more_body = message.get('more_body', False)
+        if more_body and size > max_peek_bytes:
+            # Too large to classify cheaply; stream the rest through as a read
+            buffered = {'type': 'http.request', 'body': b''.join(chunks), 'more_body': True}
+            return READ_PRIORITY, _replay(buffered, receive)
+    body = b''.join(chunks)
+
+    buffered = {'type': 'http.request', 'body': body, 'more_body': False}
+    return (WRITE_PRIORITY if _is_mutation(body) else READ_PRIORITY), _replay(buffered, receive)
+
+
+# Block strings, strings and comments are matched so their contents are skipped
+_GRAPHQL_TOKEN = re.compile(r'"""[\s\S]*?(?<!\\)"""|"(?:\\.|[^"\\\n])*"|#[^\n]*|[A-Za-z_]\w*|[{}()]')
+_OPERATION_KEYWORDS = ('query', 'mutation', 'subscription', 'fragment')
+
+
+def _operations(document: str) -> List[Tuple[str, Optional[str]]]:
+    """Return the (type, name) of each top-level definition in a GraphQL document."""
+    operations = []
+    depth = 0
+    awaiting_name = False
+    awaiting_body = False
+    for token in _GRAPHQL_TOKEN.findall(document):
+        if token[0] in '"#':
+            continue
+        if token in '{(':
+            if depth == 0 and token == '{':
+                if not awaiting_body:
+                    # Shorthand "{ ... }" is an anonymous query
+                    operations.append(('query', None))
+                awaiting_body = False
+            awaiting_name = False
+            depth += 1
+        elif token in '})':
+            depth = max(0, depth - 1)
+        elif depth == 0:
+            if awaiting_name:
+                operations[-1] = (operations[-1][0], token)
+                awaiting_name = False
+            elif token in _OPERATION_KEYWORDS and not awaiting_body:
+                operations.append((token, None))
+                awaiting_name = True
+                awaiting_body = True
+    return operations
+
+
+def _is_mutation(body: bytes) -> bool:
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return False
+
+    payloads = payload if isinstance(payload, list) else [payload]
+    for item in payloads:
+        if not isinstance(item, dict) or not isinstance(item.get('query'), str):
+            continue
+        operations = [op for op in _operations(item['query']) if op[0] != 'fragment']
+        name = item.get('operationName')
+        if name:
+            operations = [op for op in operations if op[1] == name]
+        elif len(operations) > 1:
+            # Ambiguous without operationName; GraphQL rejects it anyway
+            continue
+        if any(op_type == 'mutation' for op_type, _ in operations):
+            return True
+    return False
+
+
+def _replay(message: dict, receive):
+    sent = False
+
+    async def replay_receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return message
+        return await receive()
+
+    return replay_receive
+
+
+async def _reject(send, status: int, detail: str, retry_after: int):
+    body = json.dumps({'detail': detail}).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'retry-after', str(retry_after).encode())
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
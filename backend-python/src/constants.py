@@ -2,3 +2,20 @@ VALID_STATUSES = ['To Do', 'In Progress', 'Quality Check', 'Ready to Deliver']
 
 DEFAULT_DUE_DATE = '2025-12-24'
 
+
+# Admission control: per-route concurrency limits, bounded wait queues and
+# per-client token buckets. Route limits are keyed by path prefix.
+ADMISSION_ROUTE_LIMITS = {'/graphql': 8, '/api': 8}
+ADMISSION_DEFAULT_LIMIT = 16
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_QUEUE_TIMEOUT = 2.0
+ADMISSION_RETRY_AFTER = 1
+ADMISSION_RATE_PER_SECOND = 20.0
+ADMISSION_BURST = 40
+ADMISSION_EXEMPT_PATHS = ['/health', '/metrics']
+# Largest GraphQL body buffered to tell mutations from reads; bigger bodies count as reads
+ADMISSION_MAX_PEEK_BYTES = 64 * 1024
+# Peers whose X-Forwarded-For header is trusted to name the real client. Requests
+# from these peers without a forwarded address skip the per-client rate limit,
+# since every user behind the proxy would otherwise share one bucket.
+ADMISSION_TRUSTED_PROXIES = ['127.0.0.1', '::1']
@@ -10,9 +10,15 @@ import uvicorn
 from .database.init import init_database
 from .api.elves import api_router
 from .api.toys import schema
+from .admission import AdmissionController, AdmissionControlMiddleware
 
 app = FastAPI()
 
+admission = AdmissionController()
+
+# Added before CORS so shed responses still carry CORS headers
+app.add_middleware(AdmissionControlMiddleware, controller=admission)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -32,6 +38,10 @@ app.include_router(graphql_app, prefix="/graphql")
 async def health_check():
     return {"status": "OK", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+async def admission_metrics():
+    return admission.stats()
+
 def main():
     port = int(os.getenv("PORT", 4000))
     
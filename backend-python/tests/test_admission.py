@@ -0,0 +1,280 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+import load_test
+from src import admission
+from src.admission import (
+    AdmissionController, AdmissionControlMiddleware, _RouteLimiter, _TokenBucket,
+    _classify, _is_mutation, READ_PRIORITY, WRITE_PRIORITY
+)
+
+
+class _Downstream:
+    """Stand-in app that records request bodies and can hold requests open."""
+
+    def __init__(self):
+        self.bodies = []
+        self.gate = None
+
+    async def __call__(self, scope, receive, send):
+        body = b''
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get('body', b'')
+            more_body = message.get('more_body', False)
+        self.bodies.append(body)
+        if self.gate is not None:
+            await self.gate.wait()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+async def _call(app, path='/graphql', method='POST', chunks=(b'',), client='10.0.0.1', headers=()):
+    messages = [
+        {'type': 'http.request', 'body': chunk, 'more_body': index < len(chunks) - 1}
+        for index, chunk in enumerate(chunks)
+    ]
+    response = {}
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = dict(message['headers'])
+
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'headers': list(headers),
+        'client': (client, 1234)
+    }
+    await app(scope, receive, send)
+    return response
+
+
+def _graphql(query: str, operation_name: str = None) -> bytes:
+    payload = {'query': query}
+    if operation_name:
+        payload['operationName'] = operation_name
+    return json.dumps(payload).encode()
+
+
+async def test_write_evicts_queued_read_and_takes_next_slot():
+    limiter = _RouteLimiter(limit=1, max_queue=1)
+    assert await limiter.acquire(READ_PRIORITY, 1)
+
+    read = asyncio.create_task(limiter.acquire(READ_PRIORITY, 1))
+    await asyncio.sleep(0)
+    write = asyncio.create_task(limiter.acquire(WRITE_PRIORITY, 1))
+
+    assert await read is False
+    assert limiter.queued == 1
+
+    limiter.release()
+    assert await write is True
+    assert limiter.active == 1
+    assert limiter.shed == 1
+
+
+async def test_read_does_not_evict_queued_write():
+    limiter = _RouteLimiter(limit=1, max_queue=1)
+    assert await limiter.acquire(READ_PRIORITY, 1)
+    write = asyncio.create_task(limiter.acquire(WRITE_PRIORITY, 1))
+    await asyncio.sleep(0)
+
+    assert await limiter.acquire(READ_PRIORITY, 1) is False
+
+    limiter.release()
+    assert await write is True
+
+
+async def test_waiter_past_queue_timeout_gets_503_with_retry_after():
+    downstream = _Downstream()
+    downstream.gate = asyncio.Event()
+    controller = AdmissionController(route_limits={'/graphql': 1}, queue_timeout=0.05, retry_after=3)
+    app = AdmissionControlMiddleware(downstream, controller)
+
+    holder = asyncio.create_task(_call(app, chunks=(_graphql('{ toyOrders { id } }'),)))
+    await asyncio.sleep(0.01)
+
+    response = await _call(app, chunks=(_graphql('{ toyOrders { id } }'),))
+    assert response['status'] == 503
+    assert response['headers'][b'retry-after'] == b'3'
+    assert controller.stats()['shed'] == 1
+
+    downstream.gate.set()
+    assert (await holder)['status'] == 200
+    assert controller.limiter_for('/graphql').active == 0
+
+
+async def test_cancelled_waiter_returns_handed_over_slot():
+    limiter = _RouteLimiter(limit=1, max_queue=1)
+    assert await limiter.acquire(READ_PRIORITY, 1)
+    waiter = asyncio.create_task(limiter.acquire(READ_PRIORITY, 1))
+    await asyncio.sleep(0)
+
+    limiter.release()
+    assert limiter.active == 1
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.active == 0
+    assert limiter.queued == 0
+
+
+async def test_timed_out_and_evicted_waiters_do_not_pile_up():
+    limiter = _RouteLimiter(limit=1, max_queue=4)
+    assert await limiter.acquire(READ_PRIORITY, 1)
+
+    # The slot is never released, so only timeouts and evictions clear the queue
+    for _ in range(50):
+        results = await asyncio.gather(
+            *(limiter.acquire(READ_PRIORITY, 0.001) for _ in range(4)),
+            limiter.acquire(WRITE_PRIORITY, 0.001)
+        )
+        assert not any(results)
+        assert len(limiter._waiters) <= 2 * limiter.max_queue + 1
+
+    assert limiter.queued == 0
+    assert limiter.shed == 250
+    assert len(limiter._waiters) <= 1
+
+
+async def test_token_bucket_limits_after_burst_and_refills(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission.time, 'monotonic', lambda: now[0])
+    bucket = _TokenBucket(rate=2.0, burst=3)
+
+    assert [bucket.take('elf') for _ in range(3)] == [None, None, None]
+    assert bucket.take('elf') == pytest.approx(0.5)
+    assert bucket.take('santa') is None
+
+    now[0] += 0.5
+    assert bucket.take('elf') is None
+    assert bucket.take('elf') is not None
+    assert bucket.limited == 2
+
+
+def test_token_bucket_table_stays_bounded_and_cheap():
+    bucket = _TokenBucket(rate=20.0, burst=40, max_clients=10000)
+    buckets = bucket._buckets
+
+    start = time.perf_counter()
+    for index in range(30000):
+        assert bucket.take(f'10.{index // 65536}.{index // 256 % 256}.{index % 256}') is None
+    elapsed = time.perf_counter() - start
+
+    assert len(bucket._buckets) == 10000
+    # Capping evicts in place instead of rebuilding the table
+    assert bucket._buckets is buckets
+    # Rebuilding a 10k table per request costs about a millisecond each
+    assert elapsed < 3.0
+
+    # The most recent clients keep their buckets; the oldest were forgotten
+    assert '10.0.117.47' in bucket._buckets
+    assert '10.0.0.0' not in bucket._buckets
+
+
+async def test_rate_limited_request_gets_429():
+    app = AdmissionControlMiddleware(_Downstream(), AdmissionController(rate_per_second=1.0, burst=2))
+
+    statuses = [(await _call(app, path='/api/elves', method='GET'))['status'] for _ in range(3)]
+    assert statuses == [200, 200, 429]
+
+    response = await _call(app, path='/api/elves', method='GET', client='10.0.0.2')
+    assert response['status'] == 200
+
+
+async def test_forwarded_client_gets_its_own_bucket():
+    controller = AdmissionController(rate_per_second=1.0, burst=1)
+    app = AdmissionControlMiddleware(_Downstream(), controller)
+
+    def forwarded(address):
+        return [(b'x-forwarded-for', f'{address}, 127.0.0.1'.encode())]
+
+    assert (await _call(app, method='GET', client='127.0.0.1', headers=forwarded('1.1.1.1')))['status'] == 200
+    assert (await _call(app, method='GET', client='127.0.0.1', headers=forwarded('2.2.2.2')))['status'] == 200
+    assert (await _call(app, method='GET', client='127.0.0.1', headers=forwarded('1.1.1.1')))['status'] == 429
+
+    # A proxy that does not say who the client is is not rate limited as one user
+    for _ in range(3):
+        assert (await _call(app, method='GET', client='127.0.0.1'))['status'] == 200
+
+
+async def test_graphql_body_is_replayed_unchanged():
+    downstream = _Downstream()
+    app = AdmissionControlMiddleware(downstream)
+    body = _graphql('mutation { updateToyOrderElf(id: "1", assigned_elf: "Peppermint") { id } }')
+
+    await _call(app, chunks=(body[:10], body[10:]))
+    assert downstream.bodies == [body]
+
+
+async def test_oversized_graphql_body_streams_through_as_read():
+    downstream = _Downstream()
+    app = AdmissionControlMiddleware(downstream, AdmissionController(max_peek_bytes=8))
+    chunks = (b'{"query": ', b'"mutation { a }"', b'}')
+
+    response = await _call(app, chunks=chunks)
+    assert response['status'] == 200
+    assert downstream.bodies == [b''.join(chunks)]
+
+
+async def test_graphql_classification_uses_route_prefix_matching():
+    async def receive():
+        raise AssertionError('body should not be peeked')
+
+    priority, replay = await _classify({'method': 'POST', 'path': '/graphqlx'}, receive, 1024)
+    assert priority == WRITE_PRIORITY
+    assert replay is receive
+
+    controller = AdmissionController(route_limits={'/graphql': 1})
+    assert controller.limiter_for('/graphqlx') is controller.limiter_for('/other')
+    assert controller.limiter_for('/graphql/') is not controller.limiter_for('/other')
+
+
+async def test_health_and_metrics_skip_the_limiter():
+    controller = AdmissionController(default_limit=0, queue_timeout=0.01, rate_per_second=1.0, burst=1)
+    app = AdmissionControlMiddleware(_Downstream(), controller)
+
+    for path in ('/health', '/metrics', '/health', '/metrics'):
+        assert (await _call(app, path=path, method='GET'))['status'] == 200
+    assert (await _call(app, path='/other', method='GET'))['status'] == 503
+    assert controller.stats()['routes']['default']['admitted'] == 0
+
+
+@pytest.mark.parametrize('query, operation_name', [
+    ('mutation { a }', None),
+    ('# comment\nmutation { a }', None),
+    ('fragment F on T { id } mutation M { a { ...F } }', None),
+    ('query A { a } mutation B { b }', 'B'),
+    ('mutation ($id: ID!) { a(id: $id) { id } }', None),
+])
+def test_mutations_are_detected(query, operation_name):
+    assert _is_mutation(_graphql(query, operation_name))
+
+
+@pytest.mark.parametrize('query, operation_name', [
+    ('{ toyOrders { id } }', None),
+    ('# mutation\n{ a }', None),
+    ('query A { a } mutation B { b }', 'A'),
+    ('query ($mutation: Int) { a(x: "mutation { b }") }', None),
+])
+def test_reads_are_not_mistaken_for_mutations(query, operation_name):
+    assert not _is_mutation(_graphql(query, operation_name))
+
+
+@pytest.mark.slow
+async def test_p99_stays_bounded_at_three_times_capacity():
+    summary = await load_test.run(duration=2.0)
+    assert load_test.check(summary) == []
+    assert summary['max_queue_depth'] <= load_test.CONCURRENCY_LIMIT * 2
+
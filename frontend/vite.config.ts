@@ -9,10 +9,12 @@ export default defineConfig({
       '/api': {
         target: 'http://localhost:4000',
         changeOrigin: true,
+        xfwd: true,
       },
       '/graphql': {
         target: 'http://localhost:4000',
         changeOrigin: true,
+        xfwd: true,
       }
     }
   }